@@ -4,24 +4,37 @@
 import os
 import sys
 import json
+import pickle
 import math
+import errno
+import heapq
 import socket
+import struct
 import time
 import random
+import atexit
 import argparse
 import ipaddress
+import selectors
+import http.client
+import collections
 import urllib.request
 import urllib.error
-import concurrent.futures
+from socket import inet_aton, inet_ntoa
 from datetime import datetime
 from typing import List, Dict, Tuple
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 # ===========================
 # 1. 配置
 # ===========================
 
 DEFAULT_CONFIG = {
-    "threads": 500,
+    "threads": 2000,          # 在途 TCP 连接上限
     "timeout": 1.0,
     "test_count": 10000,      # 目标 TCP 扫描数量
     "port": 443,
@@ -40,6 +53,26 @@ TRACE_FILE = "trace.log"
 IPV4_FILE = "ipv4.txt"
 IPV6_FILE = "ipv6.txt"
 RESULT_FILE = "result.csv"
+CACHE_SUFFIX = ".pkl"         # IP 列表展开结果的缓存后缀
+VACUUM_INTERVAL = 10          # 每隔多少次保存清理一次模型中的低分网段
+
+# 预编译的网络字节序 uint32 编解码，IPv4 地址与整数互转的热路径使用
+_U32 = struct.Struct('!I')
+pack_u32 = _U32.pack
+unpack_u32 = _U32.unpack
+
+# 非阻塞 connect 的"进行中"返回码 (Windows 下为 WSAEWOULDBLOCK)
+CONNECT_IN_PROGRESS = {0, errno.EINPROGRESS, errno.EWOULDBLOCK, getattr(errno, 'WSAEWOULDBLOCK', errno.EWOULDBLOCK)}
+# Linux 下创建时即为非阻塞，省去每个探测 socket 的 setblocking 调用
+SOCK_NONBLOCK = getattr(socket, 'SOCK_NONBLOCK', 0)
+SCAN_SOCK_TYPE = socket.SOCK_STREAM | SOCK_NONBLOCK
+# 扫描循环每轮最多新发起的连接数，发起与轮询交替进行
+FEED_BATCH = 8
+# 无 epoll/kqueue 时 select() 可同时监听的 socket 上限
+SELECT_FD_LIMIT = 500
+# 探测 socket 的 SO_LINGER={1,0} 与 Linux 的 TCP_USER_TIMEOUT
+LINGER_ABORT = struct.pack('ii', 1, 0)
+TCP_USER_TIMEOUT = getattr(socket, 'TCP_USER_TIMEOUT', 0)
 
 # ===========================
 # 2. UCB 智能算法 (V5.2: 冷启动保护)
@@ -49,10 +82,11 @@ class UCBManager:
     def __init__(self, decay_rate=0.85):
         self.decay_rate = decay_rate
         self.data = {
-            "version": 5,
+            "version": 7,
             "total_runs": 0,    # 这里的 total_runs 指的是累积测试过的 IP 总数
             "launch_count": 0,  # [新增] 程序启动次数
-            "subnets": {}       
+            "generation": 0,    # 已执行的衰减轮数，子网记录按自身 gen 惰性结算
+            "subnets": {}       # /24 网络地址整数 -> 统计，落盘时键为十进制字符串
         }
         self.load()
         # 每次实例化（程序启动）增加计数
@@ -62,30 +96,64 @@ class UCBManager:
         if os.path.exists(MODEL_FILE):
             try:
                 with open(MODEL_FILE, 'r') as f:
-                    self.data = json.load(f)
+                    data = json.load(f)
+                gen = data.setdefault("generation", 0)
+                subnets = {}
+                for k, v in data["subnets"].items():
+                    # V6 及更早的记录在保存时已完成衰减
+                    v.setdefault("gen", gen)
+                    subnets[self._net_key(k)] = v
+                data["subnets"] = subnets
+                data["version"] = 7
+                self.data = data
             except: pass
 
+    @staticmethod
+    def _net_key(key: str) -> int:
+        # V5 及更早的模型以点分十进制字符串为键
+        if '.' in key:
+            return unpack_u32(inet_aton(key))[0]
+        return int(key)
+
     def save(self):
         # 仅衰减权重，不衰减启动次数
+        # 子网记录不逐条衰减，推进代数后在下次访问时结算
         self.data["total_runs"] *= self.decay_rate
-        
-        to_remove = []
-        for net, record in self.data["subnets"].items():
-            record["count"] *= self.decay_rate
-            record["total_reward"] *= self.decay_rate
-            
-            avg = record["total_reward"] / record["count"] if record["count"] > 0 else 0
-            if record["count"] < 0.5 and avg < 0.2:
-                to_remove.append(net)
-        
-        for net in to_remove:
-            del self.data["subnets"][net]
+        self.data["generation"] += 1
+        if self.data["generation"] % VACUUM_INTERVAL == 0:
+            self.vacuum()
 
-        try:
-            with open(MODEL_FILE, 'w') as f:
-                json.dump(self.data, f)
+        # 模型文件只给程序读，使用紧凑格式减小体积
+        try: atomic_dump(self.data, MODEL_FILE, separators=(',', ':'))
         except: pass
 
+    def vacuum(self):
+        """结算所有记录的衰减并清理低分网段，需遍历全部子网，仅定期执行"""
+        subnets = self.data["subnets"]
+        for net in list(subnets):
+            record = self._refresh(subnets[net])
+            avg = record["total_reward"] / record["count"] if record["count"] > 0 else 0
+            if record["count"] < 0.5 and avg < 0.2:
+                del subnets[net]
+
+    def _refresh(self, record):
+        """把记录自上次访问以来的衰减结算到当前代"""
+        gen = self.data["generation"]
+        age = gen - record["gen"]
+        if age:
+            factor = self.decay_rate ** age
+            record["count"] *= factor
+            record["total_reward"] *= factor
+            record["gen"] = gen
+        return record
+
+    def _record(self, net: int):
+        record = self.data["subnets"].get(net)
+        if record is None:
+            record = self.data["subnets"][net] = {"count": 0, "total_reward": 0.0, "gen": self.data["generation"]}
+            return record
+        return self._refresh(record)
+
     def is_cold_start(self) -> bool:
         """
         判断是否处于冷启动阶段
@@ -97,25 +165,30 @@ class UCBManager:
             return True
         return False
 
-    def update(self, ip: str, latency: float, speed: float = 0.0, is_loss: bool = False, tcp_only: bool = False):
+    @staticmethod
+    def _subnet(ip: str):
+        """返回 IPv4 地址所属 /24 的网络地址整数，IPv6 或非法地址返回 None"""
+        if ':' in ip: return None
         try:
-            if ':' in ip: return
-            net = str(ipaddress.IPv4Network(ip + "/24", strict=False).network_address)
-        except: return
+            return unpack_u32(inet_aton(ip))[0] & 0xFFFFFF00
+        except OSError: return None
 
+    @staticmethod
+    def _reward(latency: float, speed: float, is_loss: bool, tcp_only: bool) -> float:
         if is_loss:
-            current_reward = 0.0
-        else:
-            r_latency = 0.3 * (1.0 - min(max(latency - 50, 0) / 150.0, 1.0))
-            if tcp_only:
-                current_reward = r_latency
-            else:
-                r_speed = 0.7 * min(speed / 10.0, 1.0)
-                current_reward = r_latency + r_speed
+            return 0.0
+        r_latency = 0.3 * (1.0 - min(max(latency - 50, 0) / 150.0, 1.0))
+        if tcp_only:
+            return r_latency
+        r_speed = 0.7 * min(speed / 10.0, 1.0)
+        return r_latency + r_speed
+
+    def update(self, ip: str, latency: float, speed: float = 0.0, is_loss: bool = False, tcp_only: bool = False):
+        net = self._subnet(ip)
+        if net is None: return
+        current_reward = self._reward(latency, speed, is_loss, tcp_only)
 
-        if net not in self.data["subnets"]:
-            self.data["subnets"][net] = {"count": 0, "total_reward": 0.0}
-        record = self.data["subnets"][net]
+        record = self._record(net)
 
         impact_weight = 1.0 
         if record["count"] > 2.0:
@@ -127,22 +200,62 @@ class UCBManager:
         record["total_reward"] += (current_reward * impact_weight)
         self.data["total_runs"] += impact_weight
 
-    def get_score(self, subnet_ip: str) -> float:
-        record = self.data["subnets"].get(subnet_ip)
-        # 给予未探索网段极高的初始分，确保它们有机会被选中
-        if not record or record["count"] < 0.1:
-            return 9999.0 
-        
-        n = max(self.data["total_runs"], 1.0)
-        nj = record["count"]
-        avg_reward = record["total_reward"] / nj
-        exploration = math.sqrt(2 * math.log(n) / nj)
-        return avg_reward + exploration
+    def update_batch(self, probes):
+        """
+        批量写入 TCP 探测结果 [(ip, latency, is_loss), ...]
+        先按 /24 汇总，每个子网只写一次模型；降权判断以本批之前的模型为准
+        """
+        batch = {}  # net -> [record, count, total_reward, demote]
+        for ip, latency, is_loss in probes:
+            net = self._subnet(ip)
+            if net is None: continue
+            current_reward = self._reward(latency, 0.0, is_loss, True)
+
+            acc = batch.get(net)
+            if acc is None:
+                record = self._record(net)
+                demote = record["count"] > 2.0 and record["total_reward"] / record["count"] > 0.6
+                acc = batch[net] = [record, 0.0, 0.0, demote]
+
+            impact_weight = 0.2 if acc[3] and current_reward < 0.1 else 1.0
+            acc[1] += impact_weight
+            acc[2] += current_reward * impact_weight
+
+        total = 0.0
+        for record, count, reward, _ in batch.values():
+            record["count"] += count
+            record["total_reward"] += reward
+            total += count
+        self.data["total_runs"] += total
+
+    def get_scores(self, subnet_ints) -> List[float]:
+        """批量计算 UCB 分数，ln(n) 对整批只求一次"""
+        subnets = self.data["subnets"]
+        gen = self.data["generation"]
+        decay = self.decay_rate
+        log_n2 = 2 * math.log(max(self.data["total_runs"], 1.0))
+        scores = []
+        for net in subnet_ints:
+            record = subnets.get(net)
+            # 衰减只影响样本量，平均奖励是比值不受影响
+            nj = record["count"] * decay ** (gen - record["gen"]) if record else 0
+            # 给予未探索网段极高的初始分，确保它们有机会被选中
+            if nj < 0.1:
+                scores.append(9999.0)
+                continue
+            scores.append(record["total_reward"] / record["count"] + math.sqrt(log_n2 / nj))
+        return scores
 
 # ===========================
 # 3. 基础工具
 # ===========================
 
+def atomic_dump(obj, path, **kwargs):
+    """先写临时文件再原子替换，中途崩溃不会留下损坏的文件"""
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f: json.dump(obj, f, **kwargs)
+    os.replace(tmp, path)
+
 class Logger:
     @staticmethod
     def info(msg): print(f"[INFO] {msg}")
@@ -184,7 +297,7 @@ class ConfigManager:
             self.save()
 
     def save(self):
-        with open(CONFIG_FILE, 'w') as f: json.dump(self.config, f, indent=4)
+        atomic_dump(self.config, CONFIG_FILE, indent=4)
 
 class IPManager:
     @staticmethod
@@ -197,7 +310,21 @@ class IPManager:
 
     @staticmethod
     def load(fname, is_v6):
+        """
+        解析 CIDR 列表并展开为整数形式：
+        IPv4 为各 /24 的 (网络地址, 地址数)，IPv6 为各网段的网络地址
+        展开结果按源文件 mtime 缓存在 <fname>.pkl，列表未更新时直接复用
+        """
         if not os.path.exists(fname): return []
+        st = os.stat(fname)
+        stamp = (st.st_mtime_ns, st.st_size, is_v6)
+        cache = fname + CACHE_SUFFIX
+        try:
+            with open(cache, 'rb') as f:
+                cached_stamp, subnets = pickle.load(f)
+            if cached_stamp == stamp: return subnets
+        except: pass
+
         nets = []
         with open(fname, 'r') as f:
             for line in f:
@@ -206,7 +333,27 @@ class IPManager:
                     if (is_v6 and n.version == 6) or (not is_v6 and n.version == 4):
                         nets.append(n)
                 except: continue
-        return nets
+        subnets = IPManager.expand_v6(nets) if is_v6 else IPManager.expand_v4(nets)
+
+        try:
+            with open(cache, 'wb') as f: pickle.dump((stamp, subnets), f, pickle.HIGHEST_PROTOCOL)
+        except: pass
+        return subnets
+
+    @staticmethod
+    def expand_v4(nets) -> List[Tuple[int, int]]:
+        subnets = []
+        for net in nets:
+            base = int(net.network_address)
+            if net.prefixlen < 24:
+                subnets.extend((base + (i << 8), 256) for i in range(1 << (24 - net.prefixlen)))
+            elif net.num_addresses > 2:
+                subnets.append((base, net.num_addresses))
+        return subnets
+
+    @staticmethod
+    def expand_v6(nets) -> List[int]:
+        return [int(n.network_address) for n in nets]
 
 # ===========================
 # 4. 智能生成器 (V5.2: 冷启动逻辑)
@@ -214,51 +361,35 @@ class IPManager:
 
 class SmartGenerator:
     @staticmethod
-    def generate(cidrs_v4, cidrs_v6, max_total_count, ucb: UCBManager):
+    def generate(subnets_v4, bases_v6, max_total_count, ucb: UCBManager) -> List[Tuple[str, int]]:
+        """
+        subnets_v4 / bases_v6 为 IPManager.load 展开后的整数形式
+        返回 (ip, 地址族) 列表，扫描时无需再按地址判断协议族
+        """
         targets = []
         
-        # 1. 展开所有 IPv4 子网
-        all_subnets = []
-        if cidrs_v4:
-            for net in cidrs_v4:
-                if net.prefixlen < 24:
-                    all_subnets.extend(list(net.subnets(new_prefix=24)))
-                else:
-                    all_subnets.append(net)
-        
         # === 冷启动检测 ===
         if ucb.is_cold_start():
             Logger.info(f"检测到冷启动阶段 (第 {ucb.data.get('launch_count', 1)} 次运行)。")
             Logger.info(f"执行强制普查模式，目标生成数量: {max_total_count}")
             
             # 冷启动策略：完全随机，不看权重，确保覆盖面
-            # 从所有子网中随机抽取 max_total_count 个 IP
-            # 为了保证每个子网都有机会，我们先打乱子网
-            random.shuffle(all_subnets)
-            
-            # 循环抽取直到满足数量
-            while len(targets) < max_total_count:
-                for sn in all_subnets:
-                    if len(targets) >= max_total_count: break
-                    if sn.num_addresses > 2:
-                        rip = str(sn[random.randint(1, sn.num_addresses - 2)])
-                        targets.append(rip)
-                
-                # 如果一轮不够（比如 max_count 很大），就再来一轮
-                if len(targets) >= max_total_count: break
-                
-                # 如果子网数量太少，无法生成足够的不重复IP，则退出防止死循环
-                if len(all_subnets) * 254 < max_total_count and len(targets) >= len(all_subnets) * 250:
-                    break
+            # 所有子网整轮轮流抽取，不足一轮的余数随机抽样，保证每个子网都有机会
+            # 子网数量太少时按可生成的不重复 IP 数封顶
+            if subnets_v4:
+                count = min(max_total_count, len(subnets_v4) * 250)
+                rounds, rest = divmod(count, len(subnets_v4))
+                picks = subnets_v4 * rounds + random.sample(subnets_v4, rest)
+                for base, size in picks:
+                    rip_int = base + random.randint(1, size - 2)
+                    targets.append((inet_ntoa(pack_u32(rip_int)), socket.AF_INET))
 
         else:
             # === 正常 UCB 模式 ===
             Logger.info("正在评估网段质量并分配预算 (UCB Mode)...")
             
-            scored_subnets = []
-            for sn in all_subnets:
-                score = ucb.get_score(str(sn.network_address))
-                scored_subnets.append((score, sn))
+            scores = ucb.get_scores([base & 0xFFFFFF00 for base, _ in subnets_v4])
+            scored_subnets = list(zip(scores, subnets_v4))
             
             scored_subnets.sort(key=lambda x: x[0], reverse=True)
             total_subnets = len(scored_subnets)
@@ -266,7 +397,7 @@ class SmartGenerator:
             stats = {"elite": 0, "good": 0, "normal": 0, "explore": 0}
             generated_count = 0
             
-            for rank, (score, sn) in enumerate(scored_subnets):
+            for rank, (score, (base, size)) in enumerate(scored_subnets):
                 if generated_count >= max_total_count: break
                 
                 if rank < total_subnets * 0.05:   # Top 5%
@@ -286,26 +417,25 @@ class SmartGenerator:
                         count = 0
                 
                 if count > 0:
-                    real_count = min(count, sn.num_addresses - 2) if sn.num_addresses > 2 else 1
+                    real_count = min(count, size - 2)
                     picked = set()
                     for _ in range(real_count):
                         for _ in range(5):
-                            rip = str(sn[random.randint(1, sn.num_addresses - 2)])
-                            if rip not in picked:
-                                picked.add(rip)
-                                targets.append(rip)
+                            rip_int = base + random.randint(1, size - 2)
+                            if rip_int not in picked:
+                                picked.add(rip_int)
+                                targets.append((inet_ntoa(pack_u32(rip_int)), socket.AF_INET))
                                 generated_count += 1
                                 break
             
             Logger.info(f"预算分配: 精英[{stats['elite']}] 优质[{stats['good']}] 普通[{stats['normal']}] 探索[{stats['explore']}]")
 
         # IPv6 处理 (冷启动时也应该包含)
-        if cidrs_v6:
+        if bases_v6:
             limit = int(max_total_count * 0.1)
             for _ in range(limit):
-                cidr = random.choice(cidrs_v6)
-                base = int(cidr.network_address)
-                targets.append(str(ipaddress.IPv6Address(base + random.randint(1, 2**16))))
+                rip_int = random.choice(bases_v6) + random.randint(1, 1 << 16)
+                targets.append((socket.inet_ntop(socket.AF_INET6, rip_int.to_bytes(16, 'big')), socket.AF_INET6))
 
         Logger.info(f"最终生成目标: {len(targets)} 个")
         random.shuffle(targets)
@@ -332,54 +462,142 @@ class Scanner:
         self.targets = targets
         self.ucb = ucb
         self.results = []
+        self.alive = 0      # TCP 存活数，中断时为已完成部分的计数
 
-    def _tcp(self, ip):
+    def _inflight_cap(self):
+        """
+        在途连接数受文件描述符上限约束，预留少量给日志与测速
+        select() 后端 (Windows) 的 FD_SETSIZE 为 512，超出会直接抛 ValueError
+        """
+        cap = self.config['threads']
+        if resource is None or selectors.DefaultSelector is selectors.SelectSelector:
+            cap = min(cap, SELECT_FD_LIMIT)
+        if resource is not None:
+            soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+            if soft != resource.RLIM_INFINITY:
+                cap = min(cap, max(soft - 64, 1))
+        return cap
+
+    def _tcp(self, ip, family):
+        """发起非阻塞连接，返回 (socket, 发起时刻)；立即失败时 socket 为 None"""
         try:
-            s = socket.socket(socket.AF_INET6 if ':' in ip else socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(self.config['timeout'])
-            st = time.time()
-            res = s.connect_ex((ip, self.config['port']))
+            s = socket.socket(family, SCAN_SOCK_TYPE)
+        except OSError: return None, 0.0
+        if not SOCK_NONBLOCK: s.setblocking(False)
+        try:
+            # 关闭时直接发 RST，不在内核中残留 TIME_WAIT / FIN_WAIT
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_ABORT)
+            if TCP_USER_TIMEOUT:
+                s.setsockopt(socket.IPPROTO_TCP, TCP_USER_TIMEOUT, int(self.config['timeout'] * 1000))
+        except OSError: pass
+        # 计时从 connect 开始，socket 创建与选项设置不计入延迟
+        st = time.monotonic()
+        res = s.connect_ex((ip, self.config['port']))
+        if res not in CONNECT_IN_PROGRESS:
             s.close()
-            return IpResult(ip, (time.time()-st)*1000) if res == 0 else IpResult(ip, loss=True)
-        except: return IpResult(ip, loss=True)
+            return None, 0.0
+        return s, st
 
     def _http(self, ip):
+        # 直接使用 http.client，显式指定端口，IPv6 地址无需加方括号
+        conn = http.client.HTTPConnection(ip, 80, timeout=4)
         try:
-            url = f"http://{'['+ip+']' if ':' in ip else ip}/__down?bytes={20*1024*1024}"
-            req = urllib.request.Request(url, headers={"Host": "speed.cloudflare.com", "User-Agent": "CF-UCB"})
             st = time.time()
-            with urllib.request.urlopen(req, timeout=4) as r:
-                tot = 0
-                while True:
-                    d = r.read(65536)
-                    if not d: break
-                    tot += len(d)
-                    if time.time()-st > 3: break
+            conn.request("GET", f"/__down?bytes={20*1024*1024}",
+                         headers={"Host": "speed.cloudflare.com", "User-Agent": "CF-UCB"})
+            r = conn.getresponse()
+            if r.status != 200: return 0
+            tot = 0
+            # 复用同一缓冲区；每次最多读 64 KiB，保证 3 秒截止时间能及时检查
+            buf = bytearray(64 << 10)
+            while True:
+                n = r.readinto(buf)
+                if not n: break
+                tot += n
+                if time.time()-st > 3: break
             dur = time.time()-st
             return (tot/1048576)/dur if dur > 0 else 0
         except: return 0
+        finally: conn.close()
 
     def run(self):
         if not self.targets: return
-        Logger.info(f"启动 TCP 扫描 ({self.config['threads']} 线程)...")
-        
+        cap = self._inflight_cap()
+        Logger.info(f"启动 TCP 扫描 (并发 {cap})...")
+
+        timeout = self.config['timeout']
+        queue = iter(self.targets)
+        exhausted = False
+        pending = set()
+        # 超时时间统一，按发起顺序到期，队首即最早的截止时间
+        deadlines = collections.deque()
         valid = []
-        with concurrent.futures.ThreadPoolExecutor(self.config['threads']) as ex:
-            futs = {ex.submit(self._tcp, ip): ip for ip in self.targets}
-            done = 0
-            total = len(self.targets)
-            for f in concurrent.futures.as_completed(futs):
-                done += 1
-                if done % 1000 == 0 or done == total: 
-                    print(f"[*] 进度: {done}/{total}", end="\r")
-                r = f.result()
-                
-                self.ucb.update(r.ip, r.latency, speed=0.0, is_loss=r.loss, tcp_only=True)
-                if not r.loss: valid.append(r)
-        
+        probes = []
+        done = 0
+        total = len(self.targets)
+
+        def finish(r):
+            nonlocal done
+            done += 1
+            if done % 1000 == 0 or done == total:
+                print(f"[*] 进度: {done}/{total}", end="\r")
+            probes.append((r.ip, r.latency, r.loss))
+            if not r.loss: valid.append(r)
+
+        sel = selectors.DefaultSelector()
+        try:
+            while pending or not exhausted:
+                # 每轮只发起一小批连接，随即轮询已完成的握手，
+                # 避免已建立的连接排队等待而把发起耗时计入延迟
+                fed = 0
+                while not exhausted and len(pending) < cap and fed < FEED_BATCH:
+                    fed += 1
+                    target = next(queue, None)
+                    if target is None:
+                        exhausted = True
+                        break
+                    ip, family = target
+                    s, st = self._tcp(ip, family)
+                    if s is None:
+                        finish(IpResult(ip, loss=True))
+                        continue
+                    sel.register(s, selectors.EVENT_WRITE, (ip, st))
+                    pending.add(s)
+                    deadlines.append((st + timeout, s, ip))
+
+                if not pending: continue
+                if not exhausted and len(pending) < cap:
+                    wait = 0
+                else:
+                    wait = min(max(deadlines[0][0] - time.monotonic(), 0), 0.1)
+                for key, _ in sel.select(timeout=wait):
+                    s = key.fileobj
+                    ip, st = key.data
+                    err = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    latency = (time.monotonic() - st) * 1000
+                    sel.unregister(s)
+                    pending.discard(s)
+                    s.close()
+                    finish(IpResult(ip, latency) if err == 0 else IpResult(ip, loss=True))
+
+                now = time.monotonic()
+                while deadlines and deadlines[0][0] <= now:
+                    _, s, ip = deadlines.popleft()
+                    if s not in pending: continue
+                    sel.unregister(s)
+                    pending.discard(s)
+                    s.close()
+                    finish(IpResult(ip, loss=True))
+        finally:
+            for s in pending: s.close()
+            sel.close()
+            # 中断时也保留已完成的探测结果
+            self.ucb.update_batch(probes)
+            self.alive = len(valid)
+
         print("\n")
-        valid.sort()
-        self.results = valid
+        # 只有延迟最低的 speed_test_range 个会进入测速，无需全量排序
+        self.results = heapq.nsmallest(self.config['speed_test_range'], valid)
         Logger.info(f"TCP 存活: {len(valid)}")
 
     def smart_speed_test(self):
@@ -400,13 +618,12 @@ class Scanner:
             
             self.ucb.update(r.ip, r.latency, speed=s, is_loss=False, tcp_only=False)
             if s > 0.1: final.append(r)
-        
-        self.ucb.save()
 
         final.sort(key=lambda x: x.speed, reverse=True)
-        high_quality = [x for x in final if x.speed >= target]
+        high_quality, remain = [], []
+        for x in final:
+            (high_quality if x.speed >= target else remain).append(x)
         if len(high_quality) < 5:
-            remain = [x for x in final if x not in high_quality]
             high_quality.extend(remain[:5-len(high_quality)])
         
         print("-" * 50)
@@ -449,6 +666,13 @@ def main():
     targets = SmartGenerator.generate(v4, v6, cm.config['test_count'], ucb)
     
     scanner = Scanner(cm.config, targets, ucb)
+
+    # 模型只在进程退出时落盘一次，Ctrl-C 中断的运行也有意保留已完成的探测结果
+    # 一个存活主机都没有时（多半是网络不可用）整轮丢弃，不记入全丢包样本，也不消耗衰减轮次
+    def save_model():
+        if scanner.alive: ucb.save()
+    atexit.register(save_model)
+
     scanner.run()
     scanner.smart_speed_test()
 
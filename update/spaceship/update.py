@@ -1,5 +1,6 @@
 import csv
 import requests
+from requests.adapters import HTTPAdapter
 import logging
 import sys
 import os
@@ -76,6 +77,10 @@ class SpaceshipDNS:
             "Content-Type": "application/json"
         }
         self.url = f"{base_url}/{domain}"
+        # Reuse one keep-alive connection for list/delete/put calls
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=4))
+        self.session.headers.update(self.headers)
 
     def get_all_records(self):
         """Fetches all DNS records using pagination."""
@@ -86,7 +91,7 @@ class SpaceshipDNS:
         while True:
             try:
                 params = {"take": take, "skip": skip}
-                resp = requests.get(self.url, headers=self.headers, params=params)
+                resp = self.session.get(self.url, params=params)
                 resp.raise_for_status()
                 
                 items = resp.json().get('items', [])
@@ -112,7 +117,7 @@ class SpaceshipDNS:
                 chunk_size = 50
                 for i in range(0, len(delete_list), chunk_size):
                     batch = delete_list[i:i + chunk_size]
-                    requests.delete(self.url, headers=self.headers, json={"items": batch})
+                    self.session.delete(self.url, json={"items": batch})
             except Exception as e:
                 logging.error(f"Delete failed: {e}")
 
@@ -121,7 +126,7 @@ class SpaceshipDNS:
             try:
                 logging.info(f"Adding {len(add_list)} new records...")
                 payload = {"force": True, "items": add_list}
-                requests.put(self.url, headers=self.headers, json=payload)
+                self.session.put(self.url, json=payload)
             except Exception as e:
                 logging.error(f"Add failed: {e}")
 
@@ -166,23 +171,33 @@ def main():
     client = SpaceshipDNS(cfg["DOMAIN"], cfg["KEY"], cfg["SECRET"], cfg["URL"])
     current_records = client.get_all_records()
     
+    # Diff existing A records against the desired (name, address) pairs
+    # so unchanged records are left alone
+    subs = set(cfg["SUBS"])
+    desired = {(sub, ip) for sub in cfg["SUBS"] for ip in target_ips}
+    current = set()
     to_delete = []
-    to_add = []
 
-    for sub in cfg["SUBS"]:
-        # Identify records to delete (Type A matching subdomain)
-        for record in current_records:
-            if record.get('type') == 'A' and record.get('name') == sub:
-                to_delete.append(record)
-        
-        # Prepare records to add
-        for ip in target_ips:
-            to_add.append({
-                "type": "A",
-                "name": sub,
-                "address": ip,
-                "ttl": cfg["TTL"]
-            })
+    for record in current_records:
+        if record.get('type') != 'A' or record.get('name') not in subs:
+            continue
+        key = (record.get('name'), record.get('address'))
+        # Keep one matching record per pair; stale IPs, TTL changes and duplicates are replaced
+        if key in desired and key not in current and record.get('ttl') == cfg["TTL"]:
+            current.add(key)
+        else:
+            to_delete.append(record)
+
+    to_add = [
+        {
+            "type": "A",
+            "name": sub,
+            "address": ip,
+            "ttl": cfg["TTL"]
+        }
+        for sub in cfg["SUBS"] for ip in target_ips
+        if (sub, ip) not in current
+    ]
 
     if not to_delete and not to_add:
         logging.info("No changes needed.")